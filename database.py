@@ -1,31 +1,81 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime, inspect, text
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import event, Column, Index, Integer, JSON, String, Text, Boolean, DateTime, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime, timezone
 import logging
+import orjson
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-DATABASE_URL = "sqlite:///./database.db"
+DATABASE_URL = "sqlite+aiosqlite:///./database.db"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# (De)serializers for the JSON columns, applied by SQLAlchemy at the DB boundary
+def to_json(value) -> str:
+    return orjson.dumps(value).decode()
+
+def from_json(value):
+    # Fresh rows hold NULL or "[]"; skip the parser for those
+    if not value or value == "[]":
+        return []
+    try:
+        return orjson.loads(value)
+    except orjson.JSONDecodeError:
+        return []
+
+# Keep a small pool of open connections so requests don't reopen the file each time
+engine = create_async_engine(
+    DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    json_serializer=to_json,
+    json_deserializer=from_json,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Configures every new SQLite connection for concurrent reads/writes."""
+    cursor = dbapi_connection.cursor()
+    # auto_vacuum only sticks on a brand-new file, so it must run before journal_mode
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL lets the dashboard read while background tasks are writing
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
+    cursor.close()
+
+# expire_on_commit=False: async sessions can't lazy-load, so keep attributes usable after commit
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
 class Video(Base):
     __tablename__ = "videos"
 
-    id = Column(Integer, primary_key=True, index=True)
-    url = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    url = Column(String)
     status = Column(String, default="Pending")  # Pending, Transcribed, Error, Researching
     transcription = Column(Text, nullable=True)
     research_notes = Column(Text, nullable=True)
-    tweet_drafts = Column(Text, nullable=True)  # Stored as JSON string
-    sources = Column(Text, nullable=True)       # Stored as JSON string (list of URLs)
+    tweet_drafts = Column(JSON, nullable=True)  # List of tweet strings
+    sources = Column(JSON, nullable=True)       # List of URLs
     remote_job_id = Column(String, nullable=True) # ID of the job on the remote server
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # Bumped on every UPDATE; keys the dashboard's rendered-card cache
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        # Serves the dashboard's newest-first listing
+        Index("ix_videos_created_at_desc", created_at.desc()),
+        # One row per TikTok, so re-submitting a URL doesn't re-run the pipeline
+        Index("ux_videos_url", url, unique=True),
+    )
 
 class SystemConfig(Base):
     __tablename__ = "system_config"
@@ -33,34 +83,104 @@ class SystemConfig(Base):
     key = Column(String, primary_key=True, index=True)
     value = Column(String)
 
-def check_and_migrate_db():
-    """Checks for missing columns and adds them (simple migration)."""
-    inspector = inspect(engine)
+class ResearchCache(Base):
+    __tablename__ = "research_cache"
+
+    cache_key = Column(String, primary_key=True)  # sha256 hex of agent + prompt + transcription (see researcher._research_cache_key)
+    research_notes = Column(Text)
+    sources = Column(JSON)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+# Bump whenever check_and_migrate_db() learns a new step
+SCHEMA_VERSION = 6
+
+def check_and_migrate_db(conn):
+    """Checks for missing columns and adds them (simple migration).
+
+    The applied version is stored in PRAGMA user_version, so on an up-to-date
+    database this is a single pragma read instead of a schema inspection.
+    Runs on a sync connection via AsyncConnection.run_sync().
+    """
+    if conn.execute(text("PRAGMA user_version")).scalar() >= SCHEMA_VERSION:
+        return
+
+    inspector = inspect(conn)
     # If table doesn't exist, create_all will handle it, so we skip migration check
     if not inspector.has_table("videos"):
         return
 
     columns = [c['name'] for c in inspector.get_columns('videos')]
+
+    # Take the write lock up front so the whole migration is one transaction
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    if 'research_notes' not in columns:
+        logger.info("Migrating: Adding 'research_notes' column...")
+        conn.execute(text("ALTER TABLE videos ADD COLUMN research_notes TEXT"))
     
-    with engine.connect() as conn:
-        if 'research_notes' not in columns:
-            logger.info("Migrating: Adding 'research_notes' column...")
-            conn.execute(text("ALTER TABLE videos ADD COLUMN research_notes TEXT"))
+    if 'tweet_drafts' not in columns:
+        logger.info("Migrating: Adding 'tweet_drafts' column...")
+        conn.execute(text("ALTER TABLE videos ADD COLUMN tweet_drafts TEXT"))
+
+    if 'sources' not in columns:
+        logger.info("Migrating: Adding 'sources' column...")
+        conn.execute(text("ALTER TABLE videos ADD COLUMN sources TEXT"))
         
-        if 'tweet_drafts' not in columns:
-            logger.info("Migrating: Adding 'tweet_drafts' column...")
-            conn.execute(text("ALTER TABLE videos ADD COLUMN tweet_drafts TEXT"))
-
-        if 'sources' not in columns:
-            logger.info("Migrating: Adding 'sources' column...")
-            conn.execute(text("ALTER TABLE videos ADD COLUMN sources TEXT"))
-            
-        if 'remote_job_id' not in columns:
-             logger.info("Migrating: Adding 'remote_job_id' column...")
-             conn.execute(text("ALTER TABLE videos ADD COLUMN remote_job_id STRING"))
-
-        conn.commit()
-
-def init_db():
-    Base.metadata.create_all(bind=engine)
-    check_and_migrate_db()
\ No newline at end of file
+    if 'remote_job_id' not in columns:
+         logger.info("Migrating: Adding 'remote_job_id' column...")
+         conn.execute(text("ALTER TABLE videos ADD COLUMN remote_job_id STRING"))
+
+    # v5: change tracking for the dashboard card cache
+    if 'updated_at' not in columns:
+        logger.info("Migrating: Adding 'updated_at' column...")
+        conn.execute(text("ALTER TABLE videos ADD COLUMN updated_at DATETIME"))
+
+    # v6: the research cache is keyed on more than the transcription now
+    if inspector.has_table("research_cache") and 'transcription_hash' in [c['name'] for c in inspector.get_columns('research_cache')]:
+        logger.info("Migrating: Renaming 'research_cache.transcription_hash' to 'cache_key'...")
+        conn.execute(text("ALTER TABLE research_cache RENAME COLUMN transcription_hash TO cache_key"))
+
+    # v3: index the listing order, drop indexes no query uses
+    # (ix_videos_url is handled by v4 below)
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_videos_created_at_desc ON videos (created_at DESC)"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_videos_id"))
+
+    # v4: unique URLs. Existing duplicates are left alone (they hold separate
+    # research), and the step is retried on the next start. Until then
+    # add_video's NOT EXISTS check is the only thing stopping new duplicates.
+    version = SCHEMA_VERSION
+    duplicates = conn.execute(text("SELECT COUNT(*) FROM (SELECT url FROM videos GROUP BY url HAVING COUNT(*) > 1)")).scalar()
+    if duplicates:
+        logger.warning(
+            "Migrating: %s URLs appear more than once; the unique index on 'url' is skipped until they're removed. "
+            "Until then URL dedup is not enforced by the database: only /add's existence check applies, "
+            "and concurrent submissions of the same URL can still create duplicates.",
+            duplicates,
+        )
+        version = 3
+        # Keep a plain index on url so that existence check isn't a table scan
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_videos_url ON videos (url)"))
+    else:
+        # The unique index serves the same lookups, so the plain one can go
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_videos_url ON videos (url)"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_videos_url"))
+
+    conn.execute(text(f"PRAGMA user_version={version}"))
+    conn.commit()
+
+async def run_maintenance():
+    """
+    Folds the WAL back into the main file, reclaims free pages and refreshes
+    query-planner stats. Meant to run periodically while the app is quiet,
+    so the automatic checkpoint doesn't land on a request's COMMIT.
+    """
+    async with engine.connect() as conn:
+        await conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        await conn.exec_driver_sql("PRAGMA incremental_vacuum")
+        await conn.exec_driver_sql("PRAGMA optimize")
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with engine.connect() as conn:
+        await conn.run_sync(check_and_migrate_db)
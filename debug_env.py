@@ -1,7 +1,7 @@
-from dotenv import load_dotenv
 import os
+from env import load_env
 
-load_dotenv()
+load_env()
 key = os.getenv("PERPLEXITY_API_KEY")
 
 if key:
@@ -0,0 +1,8 @@
+from functools import lru_cache
+
+@lru_cache(maxsize=1)
+def load_env() -> bool:
+    """Loads the .env file once per process; later calls are free."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    return True
@@ -1,16 +1,25 @@
+from functools import lru_cache
 from google import genai
-import dotenv
+from env import load_env
 
-dotenv.load_dotenv()
+load_env()
 # If you have GEMINI_API_KEY in env, the client will pick it up automatically.
 # Otherwise, pass api_key="..." here.
 client = genai.Client()
 
-print("Models that support generateContent:\n")
-for m in client.models.list():
-    if "generateContent" in m.supported_actions:
-        print(m.name, " | ", m.display_name)
+@lru_cache(maxsize=1)
+def list_models() -> tuple:
+    """Fetches the model catalogue once; both listings below reuse it."""
+    return tuple(client.models.list())
+
+if __name__ == "__main__":
+    models = list_models()
 
-print("\nAll models:\n")
-for m in client.models.list():
-    print(m.name, " | ", m.display_name)
+    print("Models that support generateContent:\n")
+    for m in models:
+        if "generateContent" in m.supported_actions:
+            print(m.name, " | ", m.display_name)
+
+    print("\nAll models:\n")
+    for m in models:
+        print(m.name, " | ", m.display_name)
@@ -1,3 +1,5 @@
+import re
+
 # -------------------------------------------------------------------------
 # PROMPT CONFIGURATION
 # -------------------------------------------------------------------------
@@ -138,3 +140,16 @@ Output strictly a JSON object with this key:
   "tweet_drafts": ["Tweet 1", "Tweet 2"]
 }}
 """
+
+# -------------------------------------------------------------------------
+# CHUNKING
+# -------------------------------------------------------------------------
+
+# Same rule RESEARCH_SYSTEM_PROMPT describes to the model: split on two or more
+# newlines OR bullet starts OR markdown headings. Compiled once at import.
+_CHUNK_SPLIT_RE = re.compile(r"(?:\n{2,}|(?=^#{1,6} )|(?=^\* {2,})|(?=^\d+\. ))", re.MULTILINE)
+
+def split_chunks(text: str) -> list:
+    """Normalizes escaped newlines and splits text into stripped, non-empty atomic units."""
+    # One C-level split pass; each piece is stripped exactly once
+    return [block for block in map(str.strip, _CHUNK_SPLIT_RE.split(text.replace("\\n", "\n"))) if block]
@@ -1,182 +1,334 @@
-from fastapi import FastAPI, Request, Form, Depends, BackgroundTasks, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Form, Depends, HTTPException, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base, Video, SystemConfig, init_db
+from sqlalchemy import select, update, delete, exists, literal
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+from database import SessionLocal, engine, Base, Video, SystemConfig, init_db, run_maintenance
+from jinja2 import Environment, FileSystemLoader
+from markupsafe import Markup
+from collections import OrderedDict
 import httpx
+import os
 import logging
-import json
 import time
 import asyncio
 from researcher import perform_research, perform_drafting
 
-# Initialize DB (and migrate if needed)
-init_db()
-
 app = FastAPI()
-templates = Jinja2Templates(directory="templates")
+# Async Jinja env so the page can render straight from an async DB stream.
+# auto_reload=False: don't stat/re-parse templates on every request (restart the server after editing them)
+templates = Jinja2Templates(env=Environment(
+    loader=FileSystemLoader("templates"),
+    autoescape=True,
+    auto_reload=False,
+    cache_size=400,
+    enable_async=True,
+))
 
-def from_json(value):
-    if not value:
-        return []
-    try:
-        return json.loads(value)
-    except:
-        return []
+# Shared HTTP client for the Colab API (created lazily, closed on shutdown)
+_http_client: httpx.AsyncClient | None = None
+
+# Periodic SQLite checkpoint/optimize (see run_maintenance)
+MAINTENANCE_INTERVAL = 300  # seconds
+_maintenance_task: asyncio.Task | None = None
+
+# Dashboard pagination (videos per page)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Rendered video cards, keyed by (id, updated_at) so any UPDATE misses the cache
+CARD_CACHE_SIZE = 1024
+_card_cache: OrderedDict[tuple, Markup] = OrderedDict()
 
-templates.env.filters["from_json"] = from_json
+# In-process job queue for research/drafting (see enqueue_job). Colab
+# transcription jobs mostly sleep between polls, so they run as their own
+# tasks (see start_transcription) and don't hold a worker.
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+_job_queue: asyncio.Queue | None = None
+_worker_tasks: list[asyncio.Task] = []
+_transcription_tasks: set[asyncio.Task] = set()
 
-# Global state for Colab URL
-COLAB_API_URL = ""
+# Cached Colab API URL (None = not loaded yet, see get_colab_url)
+COLAB_URL_TTL = 30  # seconds
+_colab_url: str | None = None
+_colab_url_loaded_at = 0.0
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared AsyncClient so Colab calls reuse keep-alive connections
+    (and the Ngrok TLS session) instead of handshaking on every request.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            # Fail fast when the Ngrok tunnel is down; reads keep the 30s budget
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            transport=httpx.AsyncHTTPTransport(
+                # Concurrent polls to the same Ngrok host share one multiplexed connection
+                http2=True,
+                retries=2,
+                verify=False,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            ),
+        )
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def _periodic_maintenance():
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+        try:
+            # aiosqlite runs the checkpoint I/O off the event loop
+            await run_maintenance()
+        except Exception as e:
+            logger.warning("Database maintenance failed: %s", e)
 
 @app.on_event("startup")
-def load_config():
-    global COLAB_API_URL
-    db = SessionLocal()
-    try:
-        config = db.query(SystemConfig).filter(SystemConfig.key == "colab_url").first()
-        if config:
-            COLAB_API_URL = config.value
-            logger.info(f"Loaded Colab URL from DB: {COLAB_API_URL}")
-    except Exception as e:
-        logger.error(f"Failed to load config: {e}")
-    finally:
-        db.close()
+async def startup_db():
+    # Initialize DB (and migrate if needed)
+    await init_db()
+
+@app.on_event("startup")
+def warm_templates():
+    # Compile the dashboard templates before the first request needs them
+    templates.get_template("index.html")
+    templates.get_template("_video_card.html")
+
+@app.on_event("startup")
+async def start_maintenance():
+    global _maintenance_task
+    _maintenance_task = asyncio.create_task(_periodic_maintenance())
+
+@app.on_event("shutdown")
+async def stop_maintenance():
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+
+async def _pipeline_worker():
+    while True:
+        func, args = await _job_queue.get()
+        try:
+            await func(*args)
+        except Exception as e:
+            logger.error("Pipeline job %s%s failed: %s", func.__name__, args, e)
+        finally:
+            _job_queue.task_done()
+
+async def enqueue_job(func, *args):
+    """
+    Queues a research/drafting coroutine for the worker pool. At most
+    PIPELINE_WORKERS jobs run at once, so a burst of submissions can't flood
+    the event loop with concurrent research calls and starve page requests.
+    """
+    await _job_queue.put((func, args))
+
+def _transcription_done(task: asyncio.Task):
+    _transcription_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Transcription job failed: %s", task.exception())
+
+def start_transcription(video_id: int, tiktok_url: str):
+    """
+    Starts send_to_colab as its own task. The Colab job can poll for up to
+    30 minutes, so it stays outside the worker pool and only its research
+    step is queued.
+    """
+    task = asyncio.create_task(send_to_colab(video_id, tiktok_url))
+    _transcription_tasks.add(task)
+    task.add_done_callback(_transcription_done)
+
+@app.on_event("startup")
+async def start_workers():
+    global _job_queue
+    _job_queue = asyncio.Queue()
+    _worker_tasks.extend(asyncio.create_task(_pipeline_worker()) for _ in range(PIPELINE_WORKERS))
+
+@app.on_event("shutdown")
+async def stop_workers():
+    # Stop the jobs first and wait for them to unwind, then close the HTTP
+    # client they share, so an in-flight Colab poll can't hit a closed client
+    tasks = [*_worker_tasks, *_transcription_tasks]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _worker_tasks.clear()
+    await close_http_client()
+
+async def get_colab_url() -> str:
+    """
+    Returns the Colab API URL stored in SystemConfig. The lookup is cached
+    for COLAB_URL_TTL seconds, so request paths rarely hit the DB while other
+    worker processes still pick up a new URL from /set-colab-url.
+    """
+    global _colab_url, _colab_url_loaded_at
+    if _colab_url is None or time.monotonic() - _colab_url_loaded_at > COLAB_URL_TTL:
+        async with SessionLocal() as db:
+            config = await db.get(SystemConfig, "colab_url")
+        url = config.value if config else ""
+        if url and url != _colab_url:
+            logger.info("Loaded Colab URL from DB: %s", url)
+        _colab_url = url
+        _colab_url_loaded_at = time.monotonic()
+    return _colab_url
+
+async def load_video(video_id: int):
+    """Fetches a video in a short-lived session. The returned instance is detached."""
+    async with SessionLocal() as db:
+        return await db.get(Video, video_id)
 
-async def run_research_task(video_id: int):
+async def update_video(video_id: int, **fields):
+    """
+    Writes the given column values for a video in a single short transaction.
+    Background tasks use this instead of holding a session open across
+    long-running network calls.
+    """
+    async with SessionLocal.begin() as db:
+        # Plain UPDATE: no SELECT, no ORM dirty-tracking
+        result = await db.execute(update(Video).where(Video.id == video_id).values(**fields))
+        if result.rowcount == 0:
+            logger.warning("Video %s no longer exists. Skipping update.", video_id)
+
+def cached_video_card(key: tuple) -> Markup | None:
+    """Returns the cached card for an (id, updated_at) key, if any, and marks it recently used."""
+    card = _card_cache.get(key)
+    if card is not None:
+        _card_cache.move_to_end(key)
+    return card
+
+async def render_video_card(video: Video) -> Markup:
+    """
+    Returns the HTML for one dashboard card, rendering it only when the row
+    has changed since it was last shown (LRU of CARD_CACHE_SIZE cards).
+    """
+    key = (video.id, video.updated_at)
+    card = cached_video_card(key)
+    if card is not None:
+        return card
+
+    card = Markup(await templates.get_template("_video_card.html").render_async(video=video))
+    _card_cache[key] = card
+    if len(_card_cache) > CARD_CACHE_SIZE:
+        _card_cache.popitem(last=False)
+    return card
+
+async def run_research_task(video_id: int, use_cache: bool = True):
     """
     Background task to perform Deep Research and generate tweets.
+    use_cache=False forces a fresh Deep Research run (see perform_research).
     """
     print(f"DEBUG: Entering run_research_task for video {video_id}", flush=True)
-    logger.info(f"Starting research for video {video_id}")
-    db = SessionLocal()
-    video = db.query(Video).filter(Video.id == video_id).first()
+    logger.info("Starting research for video %s", video_id)
+    video = await load_video(video_id)
     
     if not video or not video.transcription:
         print(f"DEBUG: Video {video_id} missing or no transcription.", flush=True)
-        logger.error(f"Video {video_id} not found or missing transcription.")
-        db.close()
+        logger.error("Video %s not found or missing transcription.", video_id)
         return
 
     try:
         print("DEBUG: Calling perform_research...", flush=True)
         # Perform Research
-        results = await perform_research(video.transcription)
+        results = await perform_research(video.transcription, use_cache=use_cache)
         print("DEBUG: perform_research returned.", flush=True)
         
-        # Update DB
-        video.research_notes = results.get("research_notes", "")
-        # Store drafts as JSON string
-        video.tweet_drafts = json.dumps(results.get("tweet_drafts", []))
-        # Store sources as JSON string
-        video.sources = json.dumps(results.get("sources", []))
-        video.status = "Completed"
-        
-        db.commit()
-        logger.info(f"Research completed for video {video_id}")
+        # Update DB (all fields in one transaction)
+        await update_video(
+            video_id,
+            research_notes=results.get("research_notes", ""),
+            tweet_drafts=results.get("tweet_drafts", []),
+            sources=results.get("sources", []),
+            status="Completed",
+        )
+        logger.info("Research completed for video %s", video_id)
         
     except Exception as e:
         error_msg = str(e)
         print(f"DEBUG: Exception in run_research_task: {error_msg}", flush=True)
-        logger.error(f"Research failed for video {video_id}: {error_msg}")
+        logger.error("Research failed for video %s: %s", video_id, error_msg)
         
         # Handle specific Quota/Auth errors (Cloudflare 401)
         if "401" in error_msg or "Authorization" in error_msg:
-             video.status = "Quota_Exceeded"
-             video.research_notes = f"Research Failed: Insufficient Perplexity API Quota or Auth Error (401).\n\nDetails: {error_msg[:200]}..."
+             await update_video(
+                 video_id,
+                 status="Quota_Exceeded",
+                 research_notes=f"Research Failed: Insufficient Perplexity API Quota or Auth Error (401).\n\nDetails: {error_msg[:200]}...",
+             )
         else:
-             video.status = "Research_Failed"
-             video.research_notes = f"Research Failed: {error_msg}"
-             
-        db.commit()
-    finally:
-        db.close()
+             await update_video(video_id, status="Research_Failed", research_notes=f"Research Failed: {error_msg}")
 
 async def run_drafting_task(video_id: int):
     """
     Background task to ONLY generate tweets from existing research notes.
     """
-    logger.info(f"Starting drafting for video {video_id}")
-    db = SessionLocal()
-    video = db.query(Video).filter(Video.id == video_id).first()
+    logger.info("Starting drafting for video %s", video_id)
+    video = await load_video(video_id)
     
     if not video or not video.transcription or not video.research_notes:
-        logger.error(f"Video {video_id} missing transcription or research notes.")
-        db.close()
+        logger.error("Video %s missing transcription or research notes.", video_id)
         return
 
     try:
-        # Parse sources if available
-        citations = []
-        if video.sources:
-            try:
-                citations = json.loads(video.sources)
-            except Exception as e:
-                logger.warning(f"Failed to parse sources for video {video_id}: {e}")
+        # Sources come back already decoded from the JSON column
+        citations = video.sources or []
 
         # Perform Drafting
         results = await perform_drafting(video.transcription, video.research_notes, citations)
         
         # Update DB
-        video.tweet_drafts = json.dumps(results.get("tweet_drafts", []))
-        video.status = "Completed"
-        
-        db.commit()
-        logger.info(f"Drafting completed for video {video_id}")
+        await update_video(video_id, tweet_drafts=results.get("tweet_drafts", []), status="Completed")
+        logger.info("Drafting completed for video %s", video_id)
         
     except Exception as e:
-        logger.error(f"Drafting failed for video {video_id}: {e}")
-        video.status = "Error"
-        db.commit()
-    finally:
-        db.close()
+        logger.error("Drafting failed for video %s: %s", video_id, e)
+        await update_video(video_id, status="Error")
 
 async def send_to_colab(video_id: int, tiktok_url: str):
     """
     Background task to send the link to the Colab instance for transcription.
     Uses a Job ID + Polling mechanism to avoid timeouts.
     """
-    global COLAB_API_URL
-    if not COLAB_API_URL:
-        logger.warning(f"No Colab URL set. Skipping transcription for video {video_id}")
+    colab_url = await get_colab_url()
+    if not colab_url:
+        logger.warning("No Colab URL set. Skipping transcription for video %s", video_id)
         return
 
-    clean_url = COLAB_API_URL.strip().rstrip('/')
-    logger.info(f"Starting job for video {video_id} at: {clean_url}")
-    
-    db = SessionLocal()
-    video = db.query(Video).filter(Video.id == video_id).first()
+    clean_url = colab_url.strip().rstrip('/')
+    logger.info("Starting job for video %s at: %s", video_id, clean_url)
     
     try:
         # 1. Start the Job
         start_endpoint = f"{clean_url}/transcribe"
-        async with httpx.AsyncClient(timeout=30.0, verify=False) as client:
-            response = await client.post(start_endpoint, json={"url": tiktok_url})
+        client = get_http_client()
+        response = await client.post(start_endpoint, json={"url": tiktok_url})
             
         if response.status_code != 200:
-            video.status = "Error"
-            video.transcription = f"Failed to start job: {response.status_code} - {response.text}"
-            db.commit()
+            await update_video(
+                video_id,
+                status="Error",
+                transcription=f"Failed to start job: {response.status_code} - {response.text}",
+            )
             return
             
         data = response.json()
         job_id = data.get("job_id")
-        video.remote_job_id = job_id
-        video.status = "Processing"
-        db.commit()
-        logger.info(f"Job started for video {video_id}. Remote Job ID: {job_id}")
+        await update_video(video_id, remote_job_id=job_id, status="Processing")
+        logger.info("Job started for video %s. Remote Job ID: %s", video_id, job_id)
 
         # 2. Poll for Status
         job_endpoint = f"{clean_url}/job/{job_id}"
@@ -188,165 +340,264 @@ async def send_to_colab(video_id: int, tiktok_url: str):
             try:
                 await asyncio.sleep(10) # Wait 10s between checks
                 
-                async with httpx.AsyncClient(timeout=30.0, verify=False) as client:
-                    status_resp = await client.get(job_endpoint)
+                status_resp = await client.get(job_endpoint)
                 
                 if status_resp.status_code == 200:
                     job_data = status_resp.json()
                     status = job_data.get("status")
                     
                     if status == "completed":
-                        video.transcription = job_data.get("text", "")
-                        video.status = "Researching"
-                        video.remote_job_id = None # Clear job ID on success
-                        db.commit()
-                        logger.info(f"Job {job_id} completed successfully.")
+                        # Transcription and the hand-off to research land in one commit
+                        await update_video(
+                            video_id,
+                            transcription=job_data.get("text", ""),
+                            status="Researching",
+                            remote_job_id=None, # Clear job ID on success
+                        )
+                        logger.info("Job %s completed successfully.", job_id)
                         
-                        # Chain the next task
-                        await run_research_task(video_id)
+                        # Chain the next task (queued, so this poll loop's task ends here)
+                        await enqueue_job(run_research_task, video_id)
                         return
 
                     elif status == "error":
-                        video.status = "Error"
-                        video.transcription = f"Remote Job Error: {job_data.get('error')}"
-                        video.remote_job_id = None
-                        db.commit()
+                        await update_video(
+                            video_id,
+                            status="Error",
+                            transcription=f"Remote Job Error: {job_data.get('error')}",
+                            remote_job_id=None,
+                        )
                         return
                     
                     # If "processing" or "pending", continue loop
                     
                 else:
-                    logger.warning(f"Polling failed with {status_resp.status_code}. Retrying...")
+                    logger.warning("Polling failed with %s. Retrying...", status_resp.status_code)
 
             except Exception as poll_err:
-                 logger.warning(f"Polling connection error: {poll_err}. Retrying...")
+                 logger.warning("Polling connection error: %s. Retrying...", poll_err)
                  # Don't fail immediately on network blip
         
         # If loop finishes without success
-        video.status = "Timeout"
-        video.transcription = "Transcription timed out after 30 minutes."
-        db.commit()
+        await update_video(video_id, status="Timeout", transcription="Transcription timed out after 30 minutes.")
 
     except Exception as e:
-        logger.error(f"Failed to communicate with Colab for video {video_id}: {type(e).__name__}: {str(e)}")
-        video.status = "Error"
-        video.transcription = f"Connection Failed: {type(e).__name__} - {str(e)}"
-        db.commit()
-    finally:
-        db.close()
+        logger.error("Failed to communicate with Colab for video %s: %s: %s", video_id, type(e).__name__, e)
+        await update_video(
+            video_id,
+            status="Error",
+            transcription=f"Connection Failed: {type(e).__name__} - {str(e)}",
+        )
 
 @app.get("/", response_class=HTMLResponse)
-async def read_root(request: Request, db: Session = Depends(get_db)):
-    videos = db.query(Video).order_by(Video.created_at.desc()).all()
-    return templates.TemplateResponse("index.html", {
-        "request": request, 
-        "videos": videos,
-        "colab_url": COLAB_API_URL
-    })
+async def read_root(
+    request: Request,
+    page: int = Query(1, ge=1),
+    size: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
+    colab_url = await get_colab_url()
+
+    async def render():
+        # The session lives inside the generator so the queries run once the
+        # response starts, after this handler has returned.
+        async with SessionLocal() as db:
+            # The page's (id, updated_at) keys first: cached cards need nothing else
+            rows = (await db.execute(
+                select(Video.id, Video.updated_at)
+                .order_by(Video.created_at.desc())
+                .limit(size)
+                .offset((page - 1) * size)
+            )).all()
+            hits = {}
+            for row in rows:
+                card = cached_video_card((row.id, row.updated_at))
+                if card is not None:
+                    hits[row.id] = card
+
+            # Full rows (only the columns the card renders; remote_job_id is
+            # internal) just for the cards that changed, in one query
+            misses = {}
+            missing_ids = [row.id for row in rows if row.id not in hits]
+            if missing_ids:
+                misses = {video.id: video for video in await db.scalars(
+                    select(Video)
+                    .options(load_only(
+                        Video.id, Video.url, Video.status, Video.created_at, Video.updated_at,
+                        Video.transcription, Video.research_notes, Video.tweet_drafts, Video.sources,
+                    ))
+                    .where(Video.id.in_(missing_ids))
+                )}
+
+            async def cards():
+                for row in rows:
+                    if row.id in hits:
+                        yield hits[row.id]
+                    elif row.id in misses:  # absent if deleted since the first query
+                        yield await render_video_card(misses[row.id])
+
+            chunks = templates.get_template("index.html").generate_async({
+                "request": request,
+                "cards": cards(),
+                "colab_url": colab_url,
+                "page": page,
+                "size": size
+            })
+            # Send the page in ~50-piece writes rather than one per template node
+            buffer = []
+            async for chunk in chunks:
+                buffer.append(chunk)
+                if len(buffer) >= 50:
+                    yield "".join(buffer)
+                    buffer.clear()
+            if buffer:
+                yield "".join(buffer)
+
+    # Cards are rendered while the page is being sent
+    return StreamingResponse(render(), media_type="text/html")
 
 @app.post("/set-colab-url")
 async def set_colab_url(
     colab_url: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    global COLAB_API_URL
-    COLAB_API_URL = colab_url
-    
+    global _colab_url
     # Save to DB
-    config = db.query(SystemConfig).filter(SystemConfig.key == "colab_url").first()
+    config = await db.get(SystemConfig, "colab_url")
     if not config:
         config = SystemConfig(key="colab_url", value=colab_url)
         db.add(config)
     else:
         config.value = colab_url
-    db.commit()
+    await db.commit()
+    _colab_url = None
     
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/add")
 async def add_video(
-    background_tasks: BackgroundTasks,
     tiktok_url: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    # Save to DB
-    new_video = Video(url=tiktok_url)
-    db.add(new_video)
-    db.commit()
-    db.refresh(new_video)
+    # Save to DB (INSERT ... RETURNING: no flush, no identity-map object).
+    # NOT EXISTS still skips known URLs on databases where the migration
+    # couldn't create ux_videos_url; ON CONFLICT covers concurrent submits.
+    video_id = (await db.execute(
+        insert(Video)
+        .from_select([Video.url], select(literal(tiktok_url)).where(~exists().where(Video.url == tiktok_url)))
+        .on_conflict_do_nothing()
+        .returning(Video.id)
+    )).scalar_one_or_none()
+    await db.commit()
+
+    if video_id is None:
+        # Already submitted: keep the existing row and its results (use Retry to re-run)
+        logger.info("Video already exists for %s. Skipping new job.", tiktok_url)
+        return RedirectResponse(url="/", status_code=303)
     
-    # Trigger transcription in background
-    # Note: We don't pass 'db' to the background task anymore
-    background_tasks.add_task(send_to_colab, new_video.id, new_video.url)
+    # Queue transcription for the pipeline workers
+    # Note: We don't pass 'db' to the job, it opens its own sessions
+    start_transcription(video_id, tiktok_url)
     
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/retry/{video_id}")
 async def retry_video(
     video_id: int,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    video = db.query(Video).filter(Video.id == video_id).first()
+    video = (await db.execute(select(Video.transcription, Video.url).where(Video.id == video_id))).first()
     if video:
         # Smart Retry: If we already have the text, don't re-transcribe (saves GPU/Time)
         # Just run the Research/Drafting step.
         if video.transcription and len(video.transcription) > 10:
-             logger.info(f"Video {video_id} has transcription. Retrying research only.")
-             video.status = "Researching"
-             db.commit()
-             background_tasks.add_task(run_research_task, video.id)
+             logger.info("Video %s has transcription. Retrying research only.", video_id)
+             await db.execute(update(Video).where(Video.id == video_id).values(status="Researching"))
+             await db.commit()
+             await enqueue_job(run_research_task, video_id)
         else:
             # Full Retry: No text? Start from scratch.
-            logger.info(f"Retrying full workflow for video {video_id}")
-            video.status = "Pending"
-            db.commit()
-            background_tasks.add_task(send_to_colab, video.id, video.url)
+            logger.info("Retrying full workflow for video %s", video_id)
+            await db.execute(update(Video).where(Video.id == video_id).values(status="Pending"))
+            await db.commit()
+            start_transcription(video_id, video.url)
     
     return RedirectResponse(url="/", status_code=303)
 
+@app.post("/retry-bulk")
+async def retry_videos_bulk(
+    ids: list[int] = Form(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Same Smart Retry as /retry/{video_id}, with one SELECT and one UPDATE per branch."""
+    rows = (await db.execute(
+        select(Video.id, Video.transcription, Video.url).where(Video.id.in_(ids))
+    )).all()
+    research_ids, full_retries = [], []
+    for row in rows:
+        # Smart Retry: with a transcription, only the research step re-runs
+        if row.transcription and len(row.transcription) > 10:
+            research_ids.append(row.id)
+        else:
+            full_retries.append((row.id, row.url))
+
+    if research_ids:
+        await db.execute(update(Video).where(Video.id.in_(research_ids)).values(status="Researching"))
+    if full_retries:
+        await db.execute(update(Video).where(Video.id.in_([vid for vid, _ in full_retries])).values(status="Pending"))
+    await db.commit()
+    logger.info("Bulk retry: %s research-only, %s full workflow.", len(research_ids), len(full_retries))
+
+    for video_id in research_ids:
+        await enqueue_job(run_research_task, video_id)
+    for video_id, url in full_retries:
+        start_transcription(video_id, url)
+
+    return RedirectResponse(url="/", status_code=303)
+
 @app.post("/update-research/{video_id}")
 async def update_research(
     video_id: int,
-    background_tasks: BackgroundTasks,
     research_notes: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    video = db.query(Video).filter(Video.id == video_id).first()
-    if video:
-        video.research_notes = research_notes
-        video.status = "Drafting" # Or Researching, but Drafting is more specific if we had it
-        db.commit()
-        
+    result = await db.execute(
+        update(Video)
+        .where(Video.id == video_id)
+        .values(research_notes=research_notes, status="Drafting") # Or Researching, but Drafting is more specific if we had it
+    )
+    await db.commit()
+    if result.rowcount:
         # Trigger drafting
-        background_tasks.add_task(run_drafting_task, video.id)
+        await enqueue_job(run_drafting_task, video_id)
         
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/research-draft/{video_id}")
 async def research_draft_video(
     video_id: int,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    video = db.query(Video).filter(Video.id == video_id).first()
-    if video and video.transcription:
-        logger.info(f"Triggering manual Research & Draft for video {video_id}")
-        video.status = "Researching"
-        db.commit()
-        background_tasks.add_task(run_research_task, video.id)
+    # NULL != '' is never true, so this also skips videos without a transcription
+    result = await db.execute(
+        update(Video)
+        .where(Video.id == video_id, Video.transcription != "")
+        .values(status="Researching")
+    )
+    await db.commit()
+    if result.rowcount:
+        logger.info("Triggering manual Research & Draft for video %s", video_id)
+        # An explicit request wants new research, not the cached report
+        await enqueue_job(run_research_task, video_id, False)
     
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/delete/{video_id}")
 async def delete_video(
     video_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    video = db.query(Video).filter(Video.id == video_id).first()
-    if video:
-        db.delete(video)
-        db.commit()
+    await db.execute(delete(Video).where(Video.id == video_id))
+    await db.commit()
     
     return RedirectResponse(url="/", status_code=303)
 
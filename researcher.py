@@ -1,18 +1,23 @@
 import os
-import json
-import logging
+import orjson
 import httpx
+import hashlib
+import logging
 import re
 import asyncio
-import time
-from dotenv import load_dotenv
-from openai import AsyncOpenAI
+import random
+from datetime import datetime, timedelta, timezone
+from functools import partial
 from google import genai
 from google.genai import types
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from prompts import RESEARCH_SYSTEM_PROMPT, DRAFTING_SYSTEM_PROMPT, INITIAL_DRAFTING_PROMPT, WRAP_UP_DRAFTING_PROMPT
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from database import SessionLocal, ResearchCache
+from prompts import RESEARCH_SYSTEM_PROMPT, DRAFTING_SYSTEM_PROMPT, INITIAL_DRAFTING_PROMPT, WRAP_UP_DRAFTING_PROMPT, split_chunks
+from env import load_env
 
-load_dotenv()
+load_env()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,26 +26,103 @@ logger = logging.getLogger(__name__)
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 DRAFT_CHUNK_SIZE = int(os.getenv("DRAFT_CHUNK_SIZE", "3000"))
+# Upper bound on a drafting context cache's lifetime (deleted when drafting ends)
+DRAFT_CACHE_TTL = "600s"
+# Smallest prompt worth uploading as a context cache (Gemini Pro rejects caches
+# under ~4k tokens); smaller prompts rely on implicit prefix caching instead
+DRAFT_CACHE_MIN_TOKENS = int(os.getenv("DRAFT_CACHE_MIN_TOKENS", "4096"))
+# Max Gemini requests (drafting calls, context caches, Deep Research starts/polls) in flight across all pipeline jobs
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "6"))
 
 PERPLEXITY_MODEL = os.getenv("PERPLEXITY_MODEL", "sonar-deep-research")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-3-pro-preview")
 DEEP_RESEARCH_AGENT = "deep-research-pro-preview-12-2025"
+# Deep Research polling: first wait, growth factor and cap (seconds)
+RESEARCH_POLL_MIN = float(os.getenv("RESEARCH_POLL_MIN", "0.5"))
+RESEARCH_POLL_BASE = float(os.getenv("RESEARCH_POLL_BASE", "1.3"))
+RESEARCH_POLL_MAX = float(os.getenv("RESEARCH_POLL_MAX", "15.0"))
+# How long a Deep Research result is reused for an identical transcription
+RESEARCH_CACHE_TTL_DAYS = int(os.getenv("RESEARCH_CACHE_TTL_DAYS", "7"))
+
+# Citation markers in drafted tweets: matches [1], [12], [cite: 1], [cite: 12]
+_CITE_RE = re.compile(r'\[(?:cite:\s*)?(\d+)\]')
+# Joins tweets for the single citation sweep (ASCII record separator)
+_TWEET_SEP = "\x1e"
+# Markdown code fences around JSON replies (see _clean_json_markdown)
+_FENCE_START_RE = re.compile(r'\s*```(?:json)?')
+_FENCE_END_RE = re.compile(r'```\s*$')
+# "Sources" section of the Deep Research report (see _extract_sources_from_text)
+_SOURCES_HEADER_RE = re.compile(r'(?i)^\s*\*\*?Sources:?\*\*?', re.MULTILINE)
+# One URL per line: a markdown link's target if the line has one, else the first plain URL.
+# Negated classes instead of .*? so a failed match can't backtrack across ] or )
+_SOURCE_LINE_RE = re.compile(r'^(?:[^\n]*?\[[^\]\n]*\]\((https?://[^)\s]+)\)|[^\n]*?(https?://[^\s\)]+))', re.MULTILINE)
+# Fallback for drafting replies that aren't clean JSON: first [...] span
+_JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+
+# Helper to safely split very large atomic blocks (nuclear option), and the
+# fallback chunker. DRAFT_CHUNK_SIZE is fixed at import, so one instance serves every call.
+_TEXT_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=DRAFT_CHUNK_SIZE,
+    chunk_overlap=200,
+    separators=["\n\n", "\n", " ", ""],
+    keep_separator=True
+)
+
+# Structured-output schema for every drafting call
+_DRAFT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+         "tweet_drafts": {
+             "type": "ARRAY",
+             "items": {"type": "STRING"}
+         }
+    }
+}
+# Keys the drafts have come back under, checked before the fuzzy key scan
+_TWEET_KEYS = ("tweet_drafts", "tweets", "tweet_draft", "drafts")
 
 if not GEMINI_API_KEY:
     logger.warning("GEMINI_API_KEY is not set. Drafting and Research will fail.")
 
+# Rate limits / transient server errors worth retrying
+_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Consecutive failed Deep Research polls tolerated before giving up on the run
+RESEARCH_POLL_MAX_FAILURES = 5
+
 # Google Gemini Client
 google_client = None
 if GEMINI_API_KEY:
-    google_client = genai.Client(api_key=GEMINI_API_KEY)
+    google_client = genai.Client(
+        api_key=GEMINI_API_KEY,
+        # Back off and retry rate limits / transient server errors inside the SDK.
+        # Only generate_content/caches honour http_status_codes; .interactions
+        # takes just `attempts` (see _run_research_step_gemini).
+        http_options=types.HttpOptions(
+            retry_options=types.HttpRetryOptions(attempts=4, http_status_codes=list(_RETRY_STATUS_CODES)),
+            # Parallel drafting calls multiplex over one HTTP/2 connection, and
+            # idle connections are kept long enough to span the gaps between
+            # Deep Research polls
+            async_client_args={
+                "http2": True,
+                "limits": httpx.Limits(max_connections=32, max_keepalive_connections=GEMINI_CONCURRENCY, keepalive_expiry=30.0),
+            },
+        ),
+    )
+
+# Shared by every drafting call and Deep Research request, so concurrent
+# videos queue here instead of tripping Gemini's rate limit together
+_gemini_semaphore = asyncio.Semaphore(GEMINI_CONCURRENCY)
 
 # -------------------------------------------------------------------------
 
-async def perform_research(transcription: str) -> dict:
+async def perform_research(transcription: str, use_cache: bool = True) -> dict:
     """
     Orchestrates the two-step pipeline:
     1. Deep Research (Source gathering & Analysis using Gemini Deep Research)
     2. Content Drafting (Tweet generation based on step 1)
+
+    use_cache=False skips the research cache lookup (the fresh result still
+    replaces the cached one), for when the user explicitly asks for new research.
     """
     if not google_client:
         raise ValueError("Gemini API Key is missing.")
@@ -48,11 +130,18 @@ async def perform_research(transcription: str) -> dict:
     logger.info("Starting Pipeline: Step 1 - Deep Research (Gemini)...")
     
     # --- STEP 1: RESEARCH ---
-    research_data = await _run_research_step_gemini(transcription)
+    # Identical transcriptions (retries, re-posted TikToks) reuse the last result
+    cache_key = _research_cache_key(transcription)
+    research_data = await _load_cached_research(cache_key) if use_cache else None
+    if research_data:
+        logger.info("Step 1 cache hit. Skipping Deep Research.")
+    else:
+        research_data = await _run_research_step_gemini(transcription)
+        await _store_cached_research(cache_key, research_data)
     research_notes = research_data.get("research_notes", "")
     citations = research_data.get("sources", [])
     
-    logger.info(f"Step 1 Complete. Notes length: {len(research_notes)}")
+    logger.info("Step 1 Complete. Notes length: %s", len(research_notes))
     logger.info("Starting Pipeline: Step 2 - Drafting Tweets...")
 
     # --- STEP 2: DRAFTING ---
@@ -65,9 +154,57 @@ async def perform_research(transcription: str) -> dict:
         "tweet_drafts": draft_data.get("tweet_drafts", [])
     }
 
+def _research_cache_key(transcription: str) -> str:
+    """sha256 over the agent, the research prompt and the transcription, so
+    changing either of the first two stops serving the old reports."""
+    digest = hashlib.sha256()
+    for part in (DEEP_RESEARCH_AGENT, RESEARCH_SYSTEM_PROMPT, transcription):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+async def _load_cached_research(cache_key: str) -> dict | None:
+    """Returns a cached research result younger than RESEARCH_CACHE_TTL_DAYS, if any."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=RESEARCH_CACHE_TTL_DAYS)
+    try:
+        async with SessionLocal() as db:
+            row = (await db.execute(
+                select(ResearchCache.research_notes, ResearchCache.sources)
+                .where(ResearchCache.cache_key == cache_key, ResearchCache.created_at >= cutoff)
+            )).first()
+    except Exception as e:
+        logger.warning("Research cache lookup failed: %s", e)
+        return None
+    if row:
+        return {"research_notes": row.research_notes, "sources": row.sources or []}
+    return None
+
+async def _store_cached_research(cache_key: str, research_data: dict):
+    """Saves a research result; a failed write only costs the next retry a fresh run."""
+    values = {
+        "research_notes": research_data.get("research_notes", ""),
+        "sources": research_data.get("sources", []),
+        "created_at": datetime.now(timezone.utc),
+    }
+    try:
+        async with SessionLocal.begin() as db:
+            await db.execute(
+                insert(ResearchCache)
+                .values(cache_key=cache_key, **values)
+                .on_conflict_do_update(index_elements=[ResearchCache.cache_key], set_=values)
+            )
+    except Exception as e:
+        logger.warning("Research cache write failed: %s", e)
+
 async def _run_research_step_gemini(transcription: str) -> dict:
     """
     Runs Gemini Deep Research Agent via Interactions API.
+
+    The SDK's granular retry options don't apply to .interactions: create/get
+    only get its built-in retries (`attempts` times, default backoff). create
+    isn't retried here beyond that, since a repeat could start a second run;
+    status polls that still fail transiently are retried on the poll backoff,
+    up to RESEARCH_POLL_MAX_FAILURES in a row.
     """
     try:
         # Construct the input prompt
@@ -76,28 +213,39 @@ async def _run_research_step_gemini(transcription: str) -> dict:
         
         logger.info("Initiating Deep Research Interaction...")
         
-        # Start the interaction
-        def run_sync_interaction():
-            interaction = google_client.interactions.create(
+        # Start the interaction (native async client, no worker thread per call).
+        # The semaphore is held per request, never across the poll's sleeps.
+        async with _gemini_semaphore:
+            interaction = await google_client.aio.interactions.create(
                 input=prompt,
                 agent=DEEP_RESEARCH_AGENT,
                 background=True,
             )
-            return interaction
-
-        interaction = await asyncio.to_thread(run_sync_interaction)
-        logger.info(f"Research started: {interaction.id}")
-
-        # Poll for completion
+        logger.info("Research started: %s", interaction.id)
+
+        # Poll for completion: start at RESEARCH_POLL_MIN and back off to
+        # RESEARCH_POLL_MAX, so quick runs are picked up promptly and long ones
+        # aren't polled every few seconds.
+        # Jitter keeps concurrent research jobs from polling in lockstep.
+        delay = RESEARCH_POLL_MIN
+        poll_failures = 0
         while True:
-            await asyncio.sleep(10) # Non-blocking sleep
-            
-            def get_interaction_status(iid):
-                return google_client.interactions.get(iid)
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2)) # Non-blocking sleep
+            delay = min(delay * RESEARCH_POLL_BASE, RESEARCH_POLL_MAX)
 
-            interaction = await asyncio.to_thread(get_interaction_status, interaction.id)
+            try:
+                async with _gemini_semaphore:
+                    interaction = await google_client.aio.interactions.get(interaction.id)
+            except Exception as e:
+                # A blip while polling shouldn't throw away a run that's still going
+                poll_failures += 1
+                if not _is_transient_error(e) or poll_failures >= RESEARCH_POLL_MAX_FAILURES:
+                    raise
+                logger.warning("Research poll failed (%s/%s), retrying: %s", poll_failures, RESEARCH_POLL_MAX_FAILURES, e)
+                continue
+            poll_failures = 0
             
-            logger.info(f"Research Status: {interaction.status}")
+            logger.info("Research Status: %s", interaction.status)
             
             if interaction.status == "completed":
                 break
@@ -110,67 +258,67 @@ async def _run_research_step_gemini(transcription: str) -> dict:
              raise RuntimeError("Deep Research completed but returned no outputs.")
              
         final_output = interaction.outputs[-1].text
-        logger.info(f"Deep Research Output Length: {len(final_output)}")
+        logger.info("Deep Research Output Length: %s", len(final_output))
         
         # Extract sources from the text first, as they are most reliable there
         extracted_sources = _extract_sources_from_text(final_output)
         
-        # Try to parse as JSON (per prompt instructions)
-        try:
-            cleaned_content = _clean_json_markdown(final_output)
-            data = json.loads(cleaned_content)
-            
-            # If JSON is valid, extract fields
-            research_notes = data.get("research_notes", final_output)
-            json_sources = data.get("sources", [])
-            
-            # Combine sources, prioritizing extracted ones if JSON is empty
-            sources = extracted_sources if extracted_sources else json_sources
-            
-            return {"research_notes": research_notes, "sources": sources}
-            
-        except json.JSONDecodeError:
-            logger.warning("Deep Research output was not valid JSON. Using raw text as research notes.")
-            # Fallback: Treat the whole text as the report
-            return {"research_notes": final_output, "sources": extracted_sources}
+        # Try to parse as JSON (per prompt instructions). Markdown reports don't
+        # start with "{", so they skip the decode attempt altogether.
+        cleaned_content = _clean_json_markdown(final_output).lstrip()
+        if cleaned_content.startswith("{"):
+            try:
+                data = orjson.loads(cleaned_content)
+                
+                # If JSON is valid, extract fields
+                research_notes = data.get("research_notes", final_output)
+                json_sources = data.get("sources", [])
+                
+                # Combine sources, prioritizing extracted ones if JSON is empty
+                sources = extracted_sources if extracted_sources else json_sources
+                
+                return {"research_notes": research_notes, "sources": sources}
+                
+            except orjson.JSONDecodeError:
+                pass
+
+        logger.warning("Deep Research output was not valid JSON. Using raw text as research notes.")
+        # Fallback: Treat the whole text as the report
+        return {"research_notes": final_output, "sources": extracted_sources}
 
     except Exception as e:
-        logger.error(f"Research Step Failed: {e}")
+        logger.error("Research Step Failed: %s", e)
         raise e
 
+def _is_transient_error(error: Exception) -> bool:
+    """True for rate limits, 5xx responses and connection errors (as raised by the interactions client)."""
+    if getattr(error, "status_code", None) in _RETRY_STATUS_CODES:
+        return True
+    return isinstance(error, httpx.TransportError) or isinstance(error.__cause__, httpx.TransportError)
+
 def _extract_sources_from_text(text: str) -> list:
     """
     Parses 'Sources' section from Gemini text output to build a list of URLs.
     Handles various formats including numbered lists, markdown links, and plain URLs.
     """
+    # Cheap C-level probe before the MULTILINE regex scan: reports without a
+    # Sources/SOURCES section (the header's colon is optional) bail out here
+    if "ources" not in text and "OURCES" not in text:
+        logger.info("Extracted 0 sources from text report.")
+        return []
+
     sources = []
     try:
         # Find the start of the sources section (case-insensitive)
         # Look for "**Sources:**" or "Sources:" at the start of a line
-        match = re.search(r'(?i)^\s*\*\*?Sources:?\*\*?', text, re.MULTILINE)
+        match = _SOURCES_HEADER_RE.search(text)
         
         if match:
             sources_text = text[match.end():]
             
-            # Split by lines and look for numbered items or links
-            lines = sources_text.splitlines()
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Regex to find URL in "1. [Title](URL)" or "1. URL"
-                # 1. Markdown link: \[.*?\]\((.*?)\)
-                md_link_match = re.search(r'\[.*?\]\((https?://.*?)\)', line)
-                if md_link_match:
-                    sources.append(md_link_match.group(1))
-                    continue
-                    
-                # 2. Plain URL: (https?://...)
-                url_match = re.search(r'(https?://[^\s\)]+)', line)
-                if url_match:
-                    sources.append(url_match.group(1))
-                    continue
+            # One scan over the section finds the URL in "1. [Title](URL)" or "1. URL"
+            # on each line. Duplicates are kept: [N] markers index this list.
+            sources = [m.group(1) or m.group(2) for m in _SOURCE_LINE_RE.finditer(sources_text)]
         else:
              # Fallback: If no "Sources" header, just scan the whole text for a block of URLs at the end?
              # Or generally scan for all URLs? 
@@ -178,58 +326,72 @@ def _extract_sources_from_text(text: str) -> list:
              pass
 
     except Exception as e:
-        logger.warning(f"Failed to extract sources from text: {e}")
+        logger.warning("Failed to extract sources from text: %s", e)
         
-    logger.info(f"Extracted {len(sources)} sources from text report.")
+    logger.info("Extracted %s sources from text report.", len(sources))
     return sources
 
-async def perform_drafting(transcription: str, research_notes: str, citations: list = None) -> dict:
-    if not google_client:
-        logger.error("Gemini Client not initialized.")
-        return {"tweet_drafts": ["Error: GEMINI_API_KEY missing."]}
+async def _create_draft_cache(system_prompt: str) -> str | None:
+    """
+    Uploads a drafting system instruction as a Gemini context cache and returns
+    its name. Returns None (send the prompt inline) if caching isn't available.
+    Prompts below DRAFT_CACHE_MIN_TOKENS (estimated at ~4 chars per token) are
+    skipped without a request, since the API would only reject them.
+    """
+    estimated_tokens = len(system_prompt) // 4
+    if estimated_tokens < DRAFT_CACHE_MIN_TOKENS:
+        logger.info("Drafting prompt is ~%s tokens, under the %s-token cache minimum; sending it inline.", estimated_tokens, DRAFT_CACHE_MIN_TOKENS)
+        return None
+    try:
+        async with _gemini_semaphore:
+            cache = await google_client.aio.caches.create(
+                model=GEMINI_MODEL,
+                config=types.CreateCachedContentConfig(system_instruction=system_prompt, ttl=DRAFT_CACHE_TTL),
+            )
+        logger.info("Created drafting context cache %s", cache.name)
+        return cache.name
+    except Exception as e:
+        logger.info("Context cache unavailable, sending prompts inline: %s", e)
+        return None
 
-    logger.info(f"=== STARTING DRAFTING PHASE ===")
-    logger.info(f"Total Research Notes Length: {len(research_notes)}")
-    logger.info(f"Research Notes Preview (Raw): {repr(research_notes[:500])}...")
-    
-    # --- Advanced Chunking Strategy (Regex Pre-segmentation + Merge) ---
+async def _delete_draft_cache(cache_name: str):
+    """Drops a drafting context cache early instead of paying storage until its TTL."""
     try:
-        # 1. Normalize newlines
-        text = research_notes.replace("\\n", "\n")
+        async with _gemini_semaphore:
+            await google_client.aio.caches.delete(name=cache_name)
+    except Exception as e:
+        logger.warning("Failed to delete context cache %s: %s", cache_name, e)
 
-        # 2. Regex Split (Perplexity suggestion)
+def _split_research_notes(research_notes: str) -> list:
+    """Splits research notes into drafting chunks of at most ~DRAFT_CHUNK_SIZE chars."""
+    # --- Advanced Chunking Strategy (Regex Pre-segmentation + Merge) ---
+    try:
+        # 1. Normalize newlines + 2. Regex Split (Perplexity suggestion)
         # Split on two or more newlines OR bullet starts OR markdown headings.
         # This breaks the text into atomic semantic units (paragraphs, list items, headers)
-        parts = re.split(
-            r"(?:\n{2,}|(?=^#{1,6} )|(?=^\* {2,})|(?=^\d+\. ))",
-            text,
-            flags=re.MULTILINE,
-        )
-        
-        pre_chunks = [p.strip() for p in parts if p.strip()]
-        logger.info(f"Regex pre-segmentation created {len(pre_chunks)} atomic blocks.")
+        pre_chunks = split_chunks(research_notes)
+        logger.info("Regex pre-segmentation created %s atomic blocks.", len(pre_chunks))
+
+        # Everything fits once the extra whitespace is gone: no merge needed
+        if sum(map(len, pre_chunks)) + 2 * (len(pre_chunks) - 1) <= DRAFT_CHUNK_SIZE:
+            return ["\n\n".join(pre_chunks)] if pre_chunks else []
 
         # 3. Intelligent Merge to DRAFT_CHUNK_SIZE
         # We re-assemble these small blocks into larger chunks that fit the context window
         valid_chunks = []
-        current_chunk = ""
-        
-        # Helper to safely split very large atomic blocks (nuclear option)
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=DRAFT_CHUNK_SIZE,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", " ", ""],
-            keep_separator=True
-        )
+        # Blocks of the chunk being built; joined once on flush instead of += per block
+        current_blocks = []
+        current_len = 0  # len("\n\n".join(current_blocks))
 
         for block in pre_chunks:
             # If a single block is massive (unlikely but possible), split it first
             if len(block) > DRAFT_CHUNK_SIZE:
-                sub_chunks = splitter.split_text(block)
+                sub_chunks = _TEXT_SPLITTER.split_text(block)
                 # Flush current buffer
-                if current_chunk:
-                    valid_chunks.append(current_chunk.strip())
-                    current_chunk = ""
+                if current_blocks:
+                    valid_chunks.append("\n\n".join(current_blocks))
+                    current_blocks.clear()
+                    current_len = 0
                 # Add sub-chunks, keeping the last one in buffer if it fits, else flush all
                 for sub in sub_chunks:
                     if len(sub) < DRAFT_CHUNK_SIZE: # Should be true given splitter config
@@ -240,129 +402,110 @@ async def perform_drafting(transcription: str, research_notes: str, citations: l
 
             # Check if adding this block exceeds the limit
             # +2 for the newline separator
-            if len(current_chunk) + len(block) + 2 <= DRAFT_CHUNK_SIZE:
-                if current_chunk:
-                    current_chunk += "\n\n" + block
-                else:
-                    current_chunk = block
+            if current_len + len(block) + 2 <= DRAFT_CHUNK_SIZE:
+                current_len += len(block) + 2 if current_blocks else len(block)
+                current_blocks.append(block)
             else:
                 # Flush current chunk
-                if current_chunk:
-                    valid_chunks.append(current_chunk.strip())
+                if current_blocks:
+                    valid_chunks.append("\n\n".join(current_blocks))
                 # Start new chunk with current block
-                current_chunk = block
+                current_blocks = [block]
+                current_len = len(block)
         
         # Flush remaining buffer
-        if current_chunk:
-            valid_chunks.append(current_chunk.strip())
+        if current_blocks:
+            valid_chunks.append("\n\n".join(current_blocks))
 
-        logger.info(f"Advanced Chunking created {len(valid_chunks)} final chunks using size={DRAFT_CHUNK_SIZE}.")
+        logger.info("Advanced Chunking created %s final chunks using size=%s.", len(valid_chunks), DRAFT_CHUNK_SIZE)
 
     except Exception as e:
-        logger.error(f"Advanced chunking failed: {e}. Falling back to LangChain default.")
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=DRAFT_CHUNK_SIZE,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", " ", ""],
-            keep_separator=True
-        )
-        valid_chunks = splitter.split_text(research_notes)
+        logger.error("Advanced chunking failed: %s. Falling back to LangChain default.", e)
+        valid_chunks = _TEXT_SPLITTER.split_text(research_notes)
+
+    return valid_chunks
+
+async def perform_drafting(transcription: str, research_notes: str, citations: list = None) -> dict:
+    if not google_client:
+        logger.error("Gemini Client not initialized.")
+        return {"tweet_drafts": ["Error: GEMINI_API_KEY missing."]}
+
+    logger.info("=== STARTING DRAFTING PHASE ===")
+    logger.info("Total Research Notes Length: %s", len(research_notes))
+    logger.info("Research Notes Preview (Raw): %r...", research_notes[:500])
     
-    logger.info(f"Final Processing: {len(valid_chunks)} sections. Max target chunk size: {DRAFT_CHUNK_SIZE}")
+    # Fast path: notes that already fit in one chunk skip segmentation and merging
+    notes = research_notes.replace("\\n", "\n").strip()
+    if len(notes) <= DRAFT_CHUNK_SIZE:
+        valid_chunks = [notes] if notes else []
+    else:
+        valid_chunks = _split_research_notes(notes)
     
-    all_tweets = []
+    logger.info("Final Processing: %s sections. Max target chunk size: %s", len(valid_chunks), DRAFT_CHUNK_SIZE)
     
-    # Process sequentially to maintain context
+    # Same for every chunk, so it goes at the end of the system instruction:
+    # the middle chunks then send byte-identical instructions that Gemini's
+    # implicit context cache can reuse, and contents only carry the research section.
+    transcription_block = f"\n\n--- ORIGINAL TRANSCRIPTION CONTEXT (reference) ---\n{transcription}"
+
     total_chunks = len(valid_chunks)
-    for index, chunk_text in enumerate(valid_chunks):
+
+    async def draft_chunk(index: int, chunk_text: str, config: types.GenerateContentConfig) -> list:
+        """Drafts the tweets for one research chunk; returns [] if it fails."""
+        response_text = None
         try:
             chunk_len = len(chunk_text)
-            logger.info(f"--- Processing Chunk {index} ({chunk_len} chars) ---")
-            logger.debug(f"Chunk Start: {chunk_text[:100]}...") 
-            
-            # Context for system prompt: Last 3 tweets (increased from 2)
-            previous_context = ""
-            if all_tweets:
-                last_n = all_tweets[-3:] # Get last 3
-                previous_context = "\n".join([f"- {t}" for t in last_n])
-            else:
-                previous_context = "None (Start of thread)"
-                
-            logger.info(f"Context injected: {previous_context[:100]}...")
-
-            # Select prompt strategy
-            if index == 0:
-                logger.info("Using INITIAL_DRAFTING_PROMPT")
-                system_prompt = INITIAL_DRAFTING_PROMPT
-            elif index == total_chunks - 1:
-                # Wrap up strategy for the last chunk
-                logger.info("Using WRAP_UP_DRAFTING_PROMPT (Final Chunk)")
-                system_prompt = WRAP_UP_DRAFTING_PROMPT.format(previous_context=previous_context)
-            else:
-                logger.info("Using DRAFTING_SYSTEM_PROMPT")
-                # Format the DRAFTING_SYSTEM_PROMPT with the context
-                system_prompt = DRAFTING_SYSTEM_PROMPT.format(previous_context=previous_context)
+            logger.info("--- Processing Chunk %s (%s chars) ---", index, chunk_len)
+            logger.debug("Chunk Start: %s...", chunk_text[:100]) 
             
-            user_content = (
-                f"--- RESEARCH SECTION ---\n{chunk_text}\n\n"
-                f"--- ORIGINAL TRANSCRIPTION CONTEXT ---\n{transcription}\n\n"
-                "Generate the tweets based on this research section."
-            )
-
-            response = await google_client.aio.models.generate_content(
-                model=GEMINI_MODEL,
-                contents=user_content,
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,
-                    response_mime_type="application/json",
-                    response_schema={
-                        "type": "OBJECT",
-                        "properties": {
-                             "tweet_drafts": {
-                                 "type": "ARRAY",
-                                 "items": {"type": "STRING"}
-                             }
-                        }
-                    }
+            user_content = f"--- RESEARCH SECTION ---\n{chunk_text}\n\nGenerate the tweets based on this research section."
+
+            # Stream the reply so the network tail overlaps with reading it; the
+            # JSON is parsed once the stream ends
+            async with _gemini_semaphore:
+                stream = await google_client.aio.models.generate_content_stream(
+                    model=GEMINI_MODEL,
+                    contents=user_content,
+                    config=config
                 )
-            )
+                parts = [part.text async for part in stream if part.text]
+            response_text = "".join(parts)
             
-            logger.info(f"Chunk {index} Response received.")
-            logger.debug(f"Raw Response: {response.text}")
+            logger.info("Chunk %s Response received.", index)
+            logger.debug("Raw Response: %s", response_text)
             
             drafts = []
             try:
-                cleaned_text = _clean_json_markdown(response.text)
-                data = json.loads(cleaned_text)
+                cleaned_text = _clean_json_markdown(response_text)
+                data = orjson.loads(cleaned_text)
                 
                 # Case 1: Standard Dict
                 if isinstance(data, dict):
-                    # Exact match
-                    if "tweet_drafts" in data:
-                        drafts = data["tweet_drafts"]
-                    else:
+                    # Exact match on the known keys
+                    found_key = next((key for key in _TWEET_KEYS if key in data), None)
+                    if found_key is None:
                         # Fuzzy match keys
-                        found_key = None
                         for key in data.keys():
-                            if "tweet_drafts" in key.lower() or "tweets" in key.lower():
+                            lowered = key.lower()
+                            if "tweet_drafts" in lowered or "tweets" in lowered:
                                 found_key = key
                                 break
-                        if found_key:
-                            drafts = data[found_key]
-                        else:
-                            logger.warning(f"Chunk {index}: JSON dict returned but no 'tweet_drafts' key found. Keys: {list(data.keys())}")
+                    if found_key is not None:
+                        drafts = data[found_key]
+                    else:
+                        logger.warning("Chunk %s: JSON dict returned but no 'tweet_drafts' key found. Keys: %s", index, list(data.keys()))
                 
                 # Case 2: List returned directly
                 elif isinstance(data, list):
                     drafts = data
                     
-            except json.JSONDecodeError:
-                logger.warning(f"Chunk {index}: Invalid JSON. Attempting regex extraction.")
+            except orjson.JSONDecodeError:
+                logger.warning("Chunk %s: Invalid JSON. Attempting regex extraction.", index)
                 # Fallback: find ["..."] pattern
-                array_match = re.search(r'\[.*\]', response.text, re.DOTALL)
+                array_match = _JSON_ARRAY_RE.search(response_text)
                 if array_match:
                     try:
-                        potential_drafts = json.loads(array_match.group(0))
+                        potential_drafts = orjson.loads(array_match.group(0))
                         if isinstance(potential_drafts, list):
                             drafts = potential_drafts
                     except:
@@ -370,62 +513,115 @@ async def perform_drafting(transcription: str, research_notes: str, citations: l
                 
                 # If still empty, try line-based heuristic
                 if not drafts:
-                     drafts = [line.strip() for line in response.text.split('\n') if len(line) > 20 and not line.strip().startswith('```') and not line.strip().startswith('{') and not line.strip().startswith('}')]
+                     # One strip per line; skip fences and JSON braces
+                     for raw in response_text.splitlines():
+                         line = raw.strip()
+                         if len(line) > 20 and not line.startswith(('```', '{', '}')):
+                             drafts.append(line)
 
             # Normalize drafts (ensure they are strings)
             if drafts:
                 drafts = [str(d) for d in drafts if isinstance(d, (str, int, float))]
 
             if not drafts:
-                logger.warning(f"Chunk {index}: No 'tweet_drafts' found in response.")
+                logger.warning("Chunk %s: No 'tweet_drafts' found in response.", index)
             else:
-                logger.info(f"Chunk {index} generated {len(drafts)} tweets.")
+                logger.info("Chunk %s generated %s tweets.", index, len(drafts))
             
-            all_tweets.extend(drafts)
+            return drafts
             
         except Exception as e:
-            logger.error(f"Error processing chunk {index}: {e}")
-            logger.error(f"Raw Response causing error: {response.text}") # Log the culprit
-            # Continue to next chunk even if one fails
-            continue
+            logger.error("Error processing chunk %s: %s", index, e)
+            if response_text is not None:
+                logger.error("Raw Response causing error: %s", response_text) # Log the culprit
+            # Continue with the other chunks even if one fails
+            return []
+
+    # The opening chunk runs first so the rest can build on its tweets.
+    # Later chunks only depend on that context, so they draft concurrently
+    # (bounded by _gemini_semaphore) and gather() keeps them in order.
+    chunk_drafts = []
+    if valid_chunks:
+        logger.info("Chunk 0: Using INITIAL_DRAFTING_PROMPT")
+        chunk_drafts.append(await draft_chunk(0, valid_chunks[0], _draft_config(INITIAL_DRAFTING_PROMPT + transcription_block)))
+    if total_chunks > 1:
+        # Context for system prompt: Last 3 tweets of the opening chunk
+        previous_context = "\n".join(f"- {t}" for t in chunk_drafts[0][-3:]) or "None (Start of thread)"
+        logger.info("Context injected: %s...", previous_context[:100])
+
+        # The context is shared, so each template is formatted once per call.
+        # Middle chunks use DRAFTING_SYSTEM_PROMPT, the final chunk wraps up.
+        drafting_prompt = DRAFTING_SYSTEM_PROMPT.format(previous_context=previous_context) + transcription_block
+        wrap_up_prompt = WRAP_UP_DRAFTING_PROMPT.format(previous_context=previous_context) + transcription_block
+        logger.info("Chunks 1-%s: Using DRAFTING_SYSTEM_PROMPT, WRAP_UP_DRAFTING_PROMPT for the final chunk", total_chunks - 1)
+
+        # Several middle chunks share drafting_prompt: upload it once as a context cache
+        cache_name = await _create_draft_cache(drafting_prompt) if total_chunks > 3 else None
+        # One config per prompt, shared by every chunk that uses it
+        drafting_config = _draft_config(drafting_prompt, cache_name)
+        wrap_up_config = _draft_config(wrap_up_prompt)
+        try:
+            chunk_drafts.extend(await asyncio.gather(*(
+                draft_chunk(index, chunk_text, wrap_up_config if index == total_chunks - 1 else drafting_config)
+                for index, chunk_text in enumerate(valid_chunks[1:], start=1)
+            )))
+        finally:
+            if cache_name:
+                await _delete_draft_cache(cache_name)
+    all_tweets = [tweet for drafts in chunk_drafts for tweet in drafts]
 
     # --- CITATION REPLACEMENT LOGIC ---
     if citations:
-        logger.info(f"Replacing citations in {len(all_tweets)} tweets with {len(citations)} sources...")
-        logger.debug(f"Available Sources: {citations}")
-        
-        def replace_citation(match):
-            try:
-                # match.group(1) is the number N in [cite: N]
-                idx = int(match.group(1)) - 1 # 0-based index
-                if 0 <= idx < len(citations):
-                    # Gemini sources are often objects with 'uri' or 'url'
-                    source = citations[idx]
-                    if isinstance(source, dict):
-                         url = source.get("uri") or source.get("url") or str(source)
-                    else:
-                         url = str(source)
-                    return f"({url})"
-                return match.group(0) # Return original if out of bounds
-            except Exception:
-                return match.group(0)
-
-        processed_tweets = []
-        for tweet in all_tweets:
-            # Handle standard [N] and Gemini's [cite: N]
-            # Pattern matches [1], [12], [cite: 1], [cite: 12]
-            new_tweet = re.sub(r'\[(?:cite:\s*)?(\d+)\]', replace_citation, tweet)
-            processed_tweets.append(new_tweet)
+        logger.info("Replacing citations in %s tweets with %s sources...", len(all_tweets), len(citations))
+        logger.debug("Available Sources: %s", citations)
         
-        all_tweets = processed_tweets
+        # Handle standard [N] and Gemini's [cite: N]
+        replace = partial(_replace_citation, _citation_table(citations))
+        # One sub() over all tweets joined by a record separator instead of one
+        # per tweet. A count mismatch after the split means a tweet contained
+        # the separator (or a marker spanned it), so redo those per tweet.
+        joined = _TWEET_SEP.join(all_tweets)
+        if "[" in joined:
+            replaced = _CITE_RE.sub(replace, joined).split(_TWEET_SEP)
+            if len(replaced) == len(all_tweets):
+                all_tweets = replaced
+            else:
+                all_tweets = [_CITE_RE.sub(replace, tweet) if "[" in tweet else tweet for tweet in all_tweets]
         
-    logger.info(f"Drafting Complete. Generated {len(all_tweets)} tweets total.")
+    logger.info("Drafting Complete. Generated %s tweets total.", len(all_tweets))
     return {"tweet_drafts": all_tweets}
 
+def _draft_config(system_prompt: str, cached_content: str | None = None) -> types.GenerateContentConfig:
+    """Builds the structured-output config for drafting calls that share a system prompt."""
+    return types.GenerateContentConfig(
+        # A cached context already carries the system instruction
+        system_instruction=None if cached_content else system_prompt,
+        cached_content=cached_content,
+        response_mime_type="application/json",
+        response_schema=_DRAFT_RESPONSE_SCHEMA
+    )
+
+def _citation_table(citations: list) -> dict:
+    """Maps each 1-based source number to its "(url)" replacement, resolved once per call."""
+    table = {}
+    for number, source in enumerate(citations, start=1):
+        # Gemini sources are often objects with 'uri' or 'url'
+        if isinstance(source, dict):
+             url = source.get("uri") or source.get("url") or str(source)
+        else:
+             url = str(source)
+        table[number] = f"({url})"
+    return table
+
+def _replace_citation(table: dict, match: re.Match) -> str:
+    """re.sub callback: swaps a [N] marker for the URL of source N."""
+    # match.group(1) is the number N in [cite: N]; unknown N keeps the original marker
+    return table.get(int(match.group(1)), match.group(0))
+
 def _clean_json_markdown(text: str) -> str:
     """Helper to strip ```json and ``` code blocks."""
-    if text.startswith("```json"):
-        return text.replace("```json", "").replace("```", "")
-    elif text.startswith("```"):
-        return text.replace("```", "")
-    return text.strip()
+    # One slice between the fences instead of rebuilding the string per replace()
+    start = _FENCE_START_RE.match(text)
+    begin = start.end() if start else 0
+    end = _FENCE_END_RE.search(text, begin)
+    return text[begin:end.start() if end else len(text)]
@@ -13,7 +13,7 @@ fi
 
 # Install dependencies into this specific environment
 source "$VENV_PATH/bin/activate"
-uv pip install fastapi uvicorn sqlalchemy httpx openai jinja2 python-dotenv python-multipart requests
+uv pip install fastapi uvicorn sqlalchemy aiosqlite "httpx[http2]" openai orjson jinja2 python-dotenv python-multipart requests
 
 echo "Starting server..."
 python -m uvicorn receiver:app --port 8001